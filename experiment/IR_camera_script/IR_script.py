@@ -1,4 +1,9 @@
+import os
 import time
+import math
+import atexit
+import queue
+import threading
 import board
 import busio
 import numpy as np
@@ -10,25 +15,77 @@ import shutil
 
 # Global variables for region selection and live mode
 regions = []       # Each region is a dict: {'x':, 'y':, 'width':, 'height':, 'patch':}
+roi_bounds = np.empty((0, 4), dtype=np.int32)  # Raw sensor slice bounds (y0, y1, x0, x1), one row per region
 current_click = None
 selection_mode = True  # When True, allow region selection via clicks
 live_mode = False      # When True, live sensor acquisition and ROI average calc runs
 max_regions = 4
-roi_texts = []         # To store ROI average text objects (so we can remove them each frame)
+roi_texts = []         # ROI average text objects, one per region, updated in place while live
+background = None      # Cached figure background (everything except the animated live artists) for blitting
+display_skip = 2       # Refresh the figure every Nth frame (every frame is still logged); '+'/'-' keys adjust it
+LOG_FLUSH_INTERVAL = 5.0   # Seconds between batched log writes (instead of writing every frame)
 
 # --------------------------
 # Set up sensor and logging
 # --------------------------
-i2c = busio.I2C(board.SCL, board.SDA)
+# Run the bus at 1 MHz (the default is 100 kHz, where one frame readout takes ~75 ms).
+# The Raspberry Pi also needs dtparam=i2c_arm_baudrate=1000000 in /boot/config.txt.
+i2c = busio.I2C(board.SCL, board.SDA, frequency=1000000)
 mlx = adafruit_mlx90640.MLX90640(i2c)
 mlx.refresh_rate = adafruit_mlx90640.RefreshRate.REFRESH_4_HZ  # 4 Hz refresh rate
 
 # Create a unique log file name (including date and time down to seconds)
 filename = "mlx90640_data_" + time.strftime("%Y%m%d_%H%M%S") + ".txt"
-log_file = open(filename, "a")
+log_fd = os.open(filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+log_queue = queue.SimpleQueue()  # Encoded log lines waiting for the writer thread; None means stop
+log_failed = threading.Event()   # Set when a log write fails (e.g. disk full); acquisition stops
+log_error = None                 # The OSError that stopped the log writer
+
+def log_writer():
+    """Append queued log lines to the file in batches, one write every LOG_FLUSH_INTERVAL seconds."""
+    global log_error
+    closing = False
+    try:
+        while not closing:
+            batch = [log_queue.get()]  # wait for at least one line
+            deadline = time.monotonic() + LOG_FLUSH_INTERVAL
+            while batch[-1] is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(log_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            closing = batch[-1] is None
+            if closing:
+                batch.pop()
+            data = memoryview(b"".join(batch))
+            while data:
+                data = data[os.write(log_fd, data):]
+    except OSError as e:
+        log_error = e
+        log_failed.set()
+        print(f"Error writing log file {filename}: {e}. Logging stopped.")
+    finally:
+        os.close(log_fd)
+
+def close_log():
+    """Write out everything still queued and close the log file."""
+    log_queue.put(None)
+    log_writer_thread.join()
+
+# Daemon so interpreter shutdown reaches atexit, which then drains and joins it
+log_writer_thread = threading.Thread(target=log_writer, daemon=True)
+log_writer_thread.start()
+atexit.register(close_log)
+
+# Row format for the 24x32 pixel values, built once so each frame is formatted
+# with a single % call (the same trick numpy.savetxt uses) instead of 768 format() calls
+pixel_fmt = ','.join(['%.2f'] * (24 * 32))
 
 # Estimate bytes per frame (timestamp + 24x32 comma-separated pixel values)
-dummy_line = f"{time.strftime('%Y-%m-%d %H:%M:%S')} " + ','.join(['{:.2f}'.format(0.0) for _ in range(24*32)])
+dummy_line = f"{time.strftime('%Y-%m-%d %H:%M:%S')} " + pixel_fmt % ((0.0,) * (24 * 32))
 estimated_bytes = len(dummy_line) + 1  # add newline char
 
 # Get free disk space and estimate recording capacity at 4Hz
@@ -50,9 +107,11 @@ plt.subplots_adjust(bottom=0.25)  # leave space for buttons
 ax_img.set_title("Region Selection Mode:\nClick twice to define a region (max 4). Then click 'Start Live'.")
 
 # Display an initial (blank) image.
-initial_image = np.zeros((24, 32))
-# (We display the flipped image for proper orientation)
-im_disp = ax_img.imshow(np.fliplr(initial_image), vmin=0, vmax=60)
+initial_image = np.zeros((24, 32), dtype=np.float32)
+im_disp = ax_img.imshow(initial_image, vmin=0, vmax=60)
+# Mirror the x-axis for proper orientation (instead of flipping the data every frame),
+# so display coordinates are raw sensor coordinates
+ax_img.invert_xaxis()
 cbar = fig.colorbar(im_disp, ax=ax_img)
 cbar.set_label('Temperature [$^{\circ}$C]', fontsize=14)
 
@@ -71,15 +130,83 @@ button_reset = Button(ax_button_reset, "Reset Regions")
 button_edit  = Button(ax_button_edit, "Edit Regions")
 
 # --------------------------
-# Define callback functions
+# Blitting helpers
 # --------------------------
+def live_artists():
+    """Artists that change every frame while live (drawn by blitting, not by a full redraw)."""
+    return [im_disp, cbar.ax, info_text_obj] + roi_texts
+
+def set_live_artists_animated(animated):
+    """Exclude (or re-include) the live artists from full figure redraws."""
+    for artist in live_artists():
+        artist.set_animated(animated)
+
+def draw_live_artists():
+    """Draw the live artists on top of the current canvas contents."""
+    for artist in live_artists():
+        fig.draw_artist(artist)
+
+def on_draw(event):
+    """Re-cache the static background after every full redraw (e.g. resize or title change)."""
+    global background
+    background = fig.canvas.copy_from_bbox(fig.bbox)
+    if live_mode:
+        draw_live_artists()
+
+def blit_live_artists():
+    """Update the screen by restoring the cached background and redrawing only the live artists."""
+    if background is None:
+        fig.canvas.draw()
+    else:
+        fig.canvas.restore_region(background)
+        draw_live_artists()
+        fig.canvas.blit(fig.bbox)
+
+def create_roi_texts():
+    """Create one (initially empty) ROI average text per region at the region centre."""
+    for txt in roi_texts:
+        txt.remove()
+    roi_texts.clear()
+    for reg in regions:
+        center_x = reg['x'] + reg['width'] / 2
+        center_y = reg['y'] + reg['height'] / 2
+        roi_texts.append(ax_img.text(center_x, center_y, "",
+                                     color="yellow", fontsize=12, ha="center", va="center"))
+
+# --------------------------
+# ROI helpers
+# --------------------------
+def raw_roi_bounds(x, y, width, height):
+    """Convert a selected region to raw sensor slice bounds (y0, y1, x0, x1).
+
+    The x-axis is inverted rather than the data flipped, so the clicked coordinates are already
+    raw sensor coordinates. A pixel belongs to the region when its centre lies inside the rectangle.
+    Regions that contain no pixel centre return zero-size bounds (their average is NaN).
+    """
+    raw_x_min = max(0, math.ceil(x))
+    raw_x_max = min(32, math.floor(x + width) + 1)
+    raw_y_min = max(0, math.ceil(y))
+    raw_y_max = min(24, math.floor(y + height) + 1)
+    if raw_x_max <= raw_x_min or raw_y_max <= raw_y_min:
+        return (0, 0, 0, 0)
+    return (raw_y_min, raw_y_max, raw_x_min, raw_x_max)
+
+def roi_averages(data):
+    """Average of every region in one pass, using a summed-area table of the frame."""
+    # sat[y, x] holds the sum of data[:y, :x] (zero-padded first row/column)
+    np.cumsum(data, axis=0, out=sat[1:, 1:])
+    np.cumsum(sat[1:, 1:], axis=1, out=sat[1:, 1:])
+    y0, y1, x0, x1 = roi_bounds.T
+    roi_sums = sat[y1, x1] - sat[y0, x1] - sat[y1, x0] + sat[y0, x0]
+    with np.errstate(invalid='ignore'):
+        return roi_sums / ((y1 - y0) * (x1 - x0))
 
 # --------------------------
 # Define callback functions
 # --------------------------
 def on_click(event):
     """Handle mouse clicks for region selection (when not in live mode)."""
-    global current_click, regions, selection_mode, live_mode
+    global current_click, regions, roi_bounds, selection_mode, live_mode
     if not selection_mode or live_mode:
         return
     if event.inaxes != ax_img:
@@ -112,10 +239,11 @@ def on_click(event):
             return
         # Create a rectangle patch to show the selected region.
         # (No transformation is needed here because user clicks are on the displayed image.)
-        rect = patches.Rectangle((x_min - 0.5, y_min - 0.5), width, height,
+        rect = patches.Rectangle((x_min, y_min), width, height,
                                  edgecolor='red', facecolor='none', linewidth=2)
         ax_img.add_patch(rect)
         regions.append({'x': x_min, 'y': y_min, 'width': width, 'height': height, 'patch': rect})
+        roi_bounds = np.vstack([roi_bounds, raw_roi_bounds(x_min, y_min, width, height)]).astype(np.int32)
         fig.canvas.draw()
         print(f"Region added: ({x_min:.2f}, {y_min:.2f}, {width:.2f}, {height:.2f})")
         current_click = None
@@ -123,15 +251,21 @@ def on_click(event):
 def start_live_callback(event):
     """Toggle live acquisition on/off."""
     global live_mode, selection_mode
+    if log_failed.is_set() and not live_mode:
+        print("Cannot start live mode: logging stopped after a write error:", log_error)
+        return
     live_mode = not live_mode
     if live_mode:
         # When live mode starts, disable further region selection.
         selection_mode = False
+        create_roi_texts()
+        set_live_artists_animated(True)
         button_start.label.set_text("Stop Live")
         ax_img.set_title("Live Mode ON")
         info_text_obj.set_text("Live Mode ON\nCalculating ROI averages...")
     else:
         selection_mode = True
+        set_live_artists_animated(False)
         button_start.label.set_text("Start Live")
         ax_img.set_title("Region Selection Mode:\nClick to define regions (max 4)")
         info_text_obj.set_text("Live Mode OFF\nSelect regions then click 'Start Live'")
@@ -139,19 +273,35 @@ def start_live_callback(event):
 
 def reset_regions_callback(event):
     """Clear all region selections."""
-    global regions, current_click
+    global regions, roi_bounds, current_click
     for reg in regions:
-           rg['patch'].remove()
+        reg['patch'].remove()
     regions.clear()
+    roi_bounds = np.empty((0, 4), dtype=np.int32)
+    for txt in roi_texts:
+        txt.remove()
+    roi_texts.clear()
     current_click = None
     fig.canvas.draw()
     print("All regions cleared.")
 
+def on_key(event):
+    """Adjust how often the live view refreshes ('+' = less often, '-' = more often)."""
+    global display_skip
+    if event.key == '+':
+        display_skip += 1
+    elif event.key == '-':
+        display_skip = max(1, display_skip - 1)
+    else:
+        return
+    print(f"Display refresh: every {display_skip} frame(s)")
+
 def edit_regions_callback(event):
     """Switch back to editing mode (stop live if active)."""
     global live_mode, selection_mode
     if live_mode:
         live_mode = False
+        set_live_artists_animated(False)
         button_start.label.set_text("Start Live")
     selection_mode = True
     ax_img.set_title("Edit Mode: Click to add regions (max 4)")
@@ -160,85 +310,109 @@ def edit_regions_callback(event):
 
 # Connect mouse click event to on_click callback
 cid = fig.canvas.mpl_connect('button_press_event', on_click)
+# Re-cache the blitting background whenever the figure is fully redrawn
+fig.canvas.mpl_connect('draw_event', on_draw)
+# Connect key presses to the display refresh adjustment
+fig.canvas.mpl_connect('key_press_event', on_key)
 # Connect buttons to their callbacks
 button_start.on_clicked(start_live_callback)
 button_reset.on_clicked(reset_regions_callback)
 button_edit.on_clicked(edit_regions_callback)
 
 # --------------------------
-# Main loop: Live acquisition and ROI average calculation
+# Acquisition thread: read and log sensor frames off the GUI thread
 # --------------------------
-frame = np.zeros((24 * 32,))
-t_array = []
+# float32 is all the sensor resolution needs; data_array is a view of frame, so getFrame updates both
+frame = np.zeros(24 * 32, dtype=np.float32)
+data_array = frame.reshape(24, 32)
+frame_queue = queue.Queue(maxsize=1)  # Latest frame for the display (older ones are dropped, never the log)
+stop_event = threading.Event()
 
-while True:
-    if live_mode:
+def sensor_reader():
+    """Acquire and log frames while live mode is on, handing the newest one to the GUI."""
+    t_array = []
+    n_errors = 0  # Failed reads (e.g. too many I2C retries), to check the bus copes with the higher frequency
+    while not stop_event.is_set():
+        # Stop acquiring once the log writer has failed, so frames do not pile up unwritten
+        if not live_mode or log_failed.is_set():
+            time.sleep(0.1)
+            continue
         t1 = time.monotonic()
         try:
             # Acquire a new frame from the sensor
             mlx.getFrame(frame)
-            data_array = np.reshape(frame, (24, 32))
 
             # Log the frame with a full timestamp
             timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-            pixel_values_str = ','.join(['{:.2f}'.format(val) for val in data_array.flatten()])
-            log_file.write(f"{timestamp} {pixel_values_str}\n")
-            log_file.flush()
-
-            # Update the displayed image (flip horizontally for correct orientation)
-            flipped_data = np.fliplr(data_array)
-            im_disp.set_data(flipped_data)
-            im_disp.set_clim(vmin=np.min(data_array), vmax=np.max(data_array))
-
-            # Remove previous ROI average texts from the image (if any)
-            for txt in roi_texts:
-                txt.remove()
-            roi_texts.clear()
-
-            # For each region, convert display coordinates to raw sensor coordinates and calculate the average.
-
- (User clicks yield display coordinates; because we display np.fliplr(data_array), we must convert:
-            #  raw_x = 31 - (x_disp + width) ... to ... raw_x_max = 31 - x_disp)
-            info_str = "ROI Averages:\n"
-            for i, reg in enumerate(regions):
-                x_disp = reg['x']
-                y_disp = reg['y']
-                width = reg['width']
-                height = reg['height']
-                # Convert display (clicked) coordinates to raw data indices:
-                raw_x_min = int(round(31 - (x_disp + width)))
-                raw_x_max = int(round(31 - x_disp))
-                raw_y_min = int(round(y_disp))
-                raw_y_max = int(round(y_disp + height))
-                # Clamp indices within sensor bounds
-                raw_x_min = max(0, raw_x_min)
-                raw_x_max = min(31, raw_x_max)
-                raw_y_min = max(0, raw_y_min)
-                raw_y_max = min(23, raw_y_max)
-                if raw_x_max <= raw_x_min or raw_y_max <= raw_y_min:
-                    roi_avg = float('nan')
-                else:
-                    roi = data_array[raw_y_min:raw_y_max, raw_x_min:raw_x_max]
-                    roi_avg = np.mean(roi)
-                info_str += f"Region {i+1}: {roi_avg:.2f} °C   "
-                # Display the ROI average as text at the center of the region (using display coordinates)
-                center_x = x_disp + width / 2
-                center_y = y_disp + height / 2
-                txt = ax_img.text(center_x, center_y, f"{roi_avg:.1f}",
-                                  color="yellow", fontsize=12, ha="center", va="center")
-                roi_texts.append(txt)
-
-            info_str += f"\nRecording capacity: {estimated_seconds:.1f} s (~{estimated_hours:.2f} h)"
-            info_text_obj.set_text(info_str)
-
-            fig.canvas.draw()
-            plt.pause(0.001)
+            pixel_values_str = pixel_fmt % tuple(frame.tolist())
+            log_queue.put(f"{timestamp} {pixel_values_str}\n".encode())
+
+            # Replace any frame the GUI has not picked up yet with the newest one
+            try:
+                frame_queue.get_nowait()
+            except queue.Empty:
+                pass
+            frame_queue.put_nowait(data_array.copy())
 
             t_array.append(time.monotonic() - t1)
             if len(t_array) % 10 == 0:
-                print('Sample Rate: {0:2.1f} fps'.format(len(t_array)/np.sum(t_array)))
+                print('Sample Rate: {0:2.1f} fps, read errors: {1}'.format(len(t_array)/np.sum(t_array), n_errors))
         except Exception as e:
-            print("Error in live loop:", e)
+            n_errors += 1
+            print("Error in acquisition loop:", e)
             time.sleep(0.1)
-    else:
-        plt.pause(0.1)
\ No newline at end of file
+
+# --------------------------
+# Display timer: show the latest frame and ROI averages on the GUI thread
+# --------------------------
+sat = np.zeros((24 + 1, 32 + 1), dtype=np.float64)  # Summed-area table buffer reused every frame (float64 accumulation)
+frame_idx = 0
+
+def on_tick():
+    """Update the live view from the newest acquired frame (called by a matplotlib timer)."""
+    global frame_idx
+    if not live_mode:
+        return
+    if log_failed.is_set():
+        # The log writer died: leave live mode and say why
+        start_live_callback(None)
+        info_text_obj.set_text(f"Live Mode OFF\nLOGGING FAILED: {log_error}")
+        fig.canvas.draw()
+        return
+    try:
+        latest = frame_queue.get_nowait()
+    except queue.Empty:
+        return
+
+    # Only refresh the figure every display_skip-th frame; logging in the acquisition thread is unaffected
+    frame_idx += 1
+    if frame_idx % display_skip != 0:
+        return
+
+    # Update the displayed image (the mirrored x-axis takes care of orientation)
+    im_disp.set_data(latest)
+    im_disp.set_clim(vmin=np.min(latest), vmax=np.max(latest))
+
+    # Average every region at once (raw sensor bounds are computed when a region is added)
+    info_str = "ROI Averages:\n"
+    for i, roi_avg in enumerate(roi_averages(latest)):
+        info_str += f"Region {i+1}: {roi_avg:.2f} °C   "
+        # Display the ROI average at the center of the region
+        roi_texts[i].set_text(f"{roi_avg:.1f}")
+
+    info_str += f"\nRecording capacity: {estimated_seconds:.1f} s (~{estimated_hours:.2f} h)"
+    info_text_obj.set_text(info_str)
+
+    blit_live_artists()
+
+reader_thread = threading.Thread(target=sensor_reader, daemon=True)
+reader_thread.start()
+
+timer = fig.canvas.new_timer(interval=int(1000 / frames_per_second), callbacks=[(on_tick, [], {})])
+timer.start()
+
+plt.show()
+
+# Window closed: stop acquisition before the log writer is drained and closed at exit
+stop_event.set()
+reader_thread.join()
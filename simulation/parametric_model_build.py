@@ -1,10 +1,20 @@
 from build123d import *
-from ocp_vscode import show_object
 import numpy as np
 import math
+import copy
+from functools import lru_cache
 
 # Toggle DXF export on/off
 EXPORT_DXF = False
+# Toggle sending shapes to the ocp_vscode viewer (off for headless runs)
+SHOW = True
+
+def show(shape, **kwargs):
+    if SHOW:
+        # Imported on first use, so headless runs never load the viewer and
+        # SHOW can be switched on after importing this module
+        from ocp_vscode import show_object
+        show_object(shape, **kwargs)
 
 # Helper for DXF exporting
 from build123d import Unit
@@ -15,11 +25,8 @@ def export_dxf(shape, layer: str, filename: str):
         exporter.add_shape(shape, layer=layer)
         exporter.write(filename)
 
-# For reproducibility (optional)
-numpy_random = np.random.seed(42)
-
 # ---------------------------------------------------------
-# Parameters: overall width and layer heights (bottom-up)
+# Default parameters: overall width and layer heights (bottom-up)
 # ---------------------------------------------------------
 width = 10  # full horizontal extent
 
@@ -32,221 +39,274 @@ keratin_height        = 0.168
 saliva_height         = 0.01
 metal_plate_height    = 4.6
 
-overall_length = (
-    fat_nominal_height
-    + connective_tissue_height
-    + epitell_height
-    + keratin_height
-    + saliva_height
-)
+# ---------------------------------------------------------
+# Define Colors for Each Region (for display purposes)
+# ---------------------------------------------------------
+fat_color         = (0.8, 0.8, 0.8)     # light gray
+connective_color  = (1.0, 1.0, 0.0)     # yellow
+epitell_color     = (0.0, 0.0, 1.0)     # blue
+keratin_color     = (0.0, 1.0, 0.0)     # green
+saliva_color      = (0.0, 1.0, 1.0)     # cyan
+metal_plate_color = (0.5, 0.5, 0.5)     # gray
 
 # ---------------------------------------------------------
 # Functions for variable amplitude and frequency
+# (x may be a scalar or an array; one random offset is drawn per sample)
 # ---------------------------------------------------------
-def fat_ct_amplitude(x):
+def fat_ct_amplitude(x, width, rng):
     base_amplitude = 0.1 + (0.2 - 0.1) * (x / width)
-    return base_amplitude + np.random.uniform(-0.02, 0.02)
+    return base_amplitude + rng.uniform(-0.02, 0.02, size=np.shape(x))
 
-def fat_ct_frequency(x):
+def fat_ct_frequency(x, width, rng):
     base_frequency = 5.0 + (3.0 - 5.0) * (x / width)
-    return base_frequency + np.random.uniform(-0.5, 0.5)
+    return base_frequency + rng.uniform(-0.5, 0.5, size=np.shape(x))
 
-def ct_epitell_amplitude(x):
+def ct_epitell_amplitude(x, width, rng):
     base_amplitude = 0.08 + (0.12 - 0.08) * (x / width)
-    return base_amplitude + np.random.uniform(-0.01, 0.01)
+    return base_amplitude + rng.uniform(-0.01, 0.01, size=np.shape(x))
 
-def ct_epitell_frequency(x):
+def ct_epitell_frequency(x, width, rng):
     base_frequency = 38.0 + (42.0 - 38.0) * (x / width)
-    return base_frequency + np.random.uniform(-2.0, 2.0)
+    return base_frequency + rng.uniform(-2.0, 2.0, size=np.shape(x))
 
 # ---------------------------------------------------------
-# Sinus Interface Points
+# Non-overlapping circle placement (rejection sampling)
 # ---------------------------------------------------------
-n_samples_fat_ct = 200
-x_samples_fat_ct = np.linspace(0, width, n_samples_fat_ct)
-fat_ct_interface_points = [
-    (
-        x,
-        fat_nominal_height + fat_ct_amplitude(x) * math.sin(
-            2 * math.pi * fat_ct_frequency(x) * (x / width)
-        ),
-    )
-    for x in x_samples_fat_ct
-]
-
-n_samples_ct_epitell = 200
-nominal_ct_epitell = fat_nominal_height + connective_tissue_height
-x_samples_ct_epitell = np.linspace(0, width, n_samples_ct_epitell)
-ct_epitell_interface_points = [
-    (
-        x,
-        nominal_ct_epitell + ct_epitell_amplitude(x) * math.sin(
-            2 * math.pi * ct_epitell_frequency(x) * (x / width)
-        ),
-    )
-    for x in x_samples_ct_epitell
-]
+def place_circles(radii, y_min, y_max, width, rng, max_tries=1000):
+    """Place circles inside [0, width] x [y_min, y_max] without overlap.
 
-avg_ct_epitell_y = np.mean([pt[1] for pt in ct_epitell_interface_points])
-epitell_top = avg_ct_epitell_y + epitell_height
+    All max_tries candidates for a circle are drawn in one call and checked
+    against all placed circles at once; the first valid one is kept. Circles
+    that cannot be placed are skipped, so the returned centers (N, 2) and
+    radii (N,) always belong together.
+    """
+    # Preallocated for every circle; only the first n_placed rows are in use
+    centers = np.empty((len(radii), 2))
+    placed_radii = np.empty(len(radii))
+    n_placed = 0
+    for r_new in radii:
+        # Too wide for the band: skip it (rng.uniform raises when high < low)
+        if 2 * r_new > min(width, y_max - y_min):
+            continue
+        candidates = rng.uniform(
+            [r_new, y_min + r_new], [width - r_new, y_max - r_new], size=(max_tries, 2)
+        )
+        dists = np.hypot(
+            candidates[:, 0, None] - centers[:n_placed, 0],
+            candidates[:, 1, None] - centers[:n_placed, 1],
+        )
+        valid = np.all(dists >= r_new + placed_radii[:n_placed], axis=1)
+        if valid.any():
+            centers[n_placed] = candidates[np.argmax(valid)]
+            placed_radii[n_placed] = r_new
+            n_placed += 1
+    return centers[:n_placed], placed_radii[:n_placed]
 
 # ---------------------------------------------------------
-# Define Colors for Each Region (for display purposes)
+# Straight layers
 # ---------------------------------------------------------
-fat_color         = (0.8, 0.8, 0.8)     # light gray
-connective_color  = (1.0, 1.0, 0.0)     # yellow
-epitell_color     = (0.0, 0.0, 1.0)     # blue
-keratin_color     = (0.0, 1.0, 0.0)     # green
-saliva_color      = (0.0, 1.0, 1.0)     # cyan
-metal_plate_color = (0.5, 0.5, 0.5)     # gray
+def rectangle_face(width, y_bottom, y_top):
+    """Full-width rectangular face between y_bottom and y_top."""
+    with BuildSketch(Plane.XY):
+        with BuildLine():
+            Line((0, y_bottom), (width, y_bottom))
+            Line((width, y_bottom), (width, y_top))
+            Line((width, y_top), (0, y_top))
+            Line((0, y_top), (0, y_bottom))
+        face = make_face()
+    return face
+
+@lru_cache(maxsize=16)
+def overall_outline_face(width, overall_length):
+    """Overall outline; it does not depend on the seed, so it is built once per parameter set.
+
+    Callers get the shared cached face and must copy it before handing it out.
+    """
+    return rectangle_face(width, 0, overall_length)
 
 # ---------------------------------------------------------
 # Build and Export Shapes
 # ---------------------------------------------------------
-# Overall outline
-with BuildPart() as base_part:
-    with BuildSketch(Plane.XY) as overall_sketch:
+def build_model(
+    seed=42,
+    width=width,
+    fat_nominal_height=fat_nominal_height,
+    connective_tissue_height=connective_tissue_height,
+    epitell_height=epitell_height,
+    keratin_height=keratin_height,
+    saliva_height=saliva_height,
+    metal_plate_height=metal_plate_height,
+    dxf_dir="ParameterizedDesign/DXF",
+):
+    """Build (and optionally show/export) one tongue model realisation.
+
+    The seed drives all random interface and circle geometry, so a parameter
+    sweep can call this repeatedly in one process. Returns the region faces by name.
+    """
+    # For reproducibility
+    rng = np.random.default_rng(seed)
+
+    overall_length = (
+        fat_nominal_height
+        + connective_tissue_height
+        + epitell_height
+        + keratin_height
+        + saliva_height
+    )
+
+    # ---------------------------------------------------------
+    # Sinus Interface Points
+    # ---------------------------------------------------------
+    two_pi_over_width = math.tau / width  # phase per unit x for a frequency of one period over the width
+
+    n_samples_fat_ct = 200
+    x_samples_fat_ct = np.linspace(0, width, n_samples_fat_ct)
+    fat_ct_interface_y = fat_nominal_height + fat_ct_amplitude(x_samples_fat_ct, width, rng) * np.sin(
+        two_pi_over_width * fat_ct_frequency(x_samples_fat_ct, width, rng) * x_samples_fat_ct
+    )
+    fat_ct_interface_points = np.column_stack([x_samples_fat_ct, fat_ct_interface_y])  # (N, 2)
+
+    n_samples_ct_epitell = 200
+    nominal_ct_epitell = fat_nominal_height + connective_tissue_height
+    x_samples_ct_epitell = np.linspace(0, width, n_samples_ct_epitell)
+    ct_epitell_interface_y = nominal_ct_epitell + ct_epitell_amplitude(x_samples_ct_epitell, width, rng) * np.sin(
+        two_pi_over_width * ct_epitell_frequency(x_samples_ct_epitell, width, rng) * x_samples_ct_epitell
+    )
+    ct_epitell_interface_points = np.column_stack([x_samples_ct_epitell, ct_epitell_interface_y])  # (N, 2)
+
+    avg_ct_epitell_y = ct_epitell_interface_points[:, 1].mean()
+    epitell_top = avg_ct_epitell_y + epitell_height
+    keratin_top = epitell_top + keratin_height
+    saliva_top = keratin_top + saliva_height
+    plate_top = saliva_top + metal_plate_height
+
+    # Overall outline
+    # Copy of the cached outline, so changes by one caller do not leak into later realisations
+    overall_face = copy.copy(overall_outline_face(width, overall_length))
+    show(overall_face)
+    export_dxf(overall_face, "Overall", f"{dxf_dir}/overall_face.dxf")
+
+    # Fat region
+    with BuildSketch(Plane.XY) as fat_sketch:
         with BuildLine():
             Line((0, 0), (width, 0))
-            Line((width, 0), (width, overall_length))
-            Line((width, overall_length), (0, overall_length))
-            Line((0, overall_length), (0, 0))
-        overall_face = make_face()
-    show_object(overall_face)
-export_dxf(overall_face, "Overall", "./ParameterizedDesign/DXF/overall_face.dxf")
-
-# Fat region
-with BuildSketch(Plane.XY) as fat_sketch:
-    with BuildLine():
-        Line((0, 0), (width, 0))
-        Line((width, 0), (width, fat_ct_interface_points[-1][1]))
-        Spline(fat_ct_interface_points)
-        Line((0, fat_ct_interface_points[0][1]), (0, 0))
-    fat_face = make_face()
-show_object(fat_face, options={"color": fat_color})
-export_dxf(fat_face, "Fat", "ParameterizedDesign/DXF/fat_face.dxf")
-
-# Connective tissue (outer)
-with BuildSketch(Plane.XY) as connective_sketch:
-    with BuildLine():
-        Spline(fat_ct_interface_points)
-        Line((width, fat_ct_interface_points[-1][1]), (width, ct_epitell_interface_points[-1][1]))
-        Spline(ct_epitell_interface_points)
-        Line((0, ct_epitell_interface_points[0][1]), (0, fat_ct_interface_points[0][1]))
-    outer_connective_face = make_face()
-show_object(outer_connective_face, options={"color": connective_color})
-
-# Create and cut circles in connective tissue
-n_circles = 20
-mean_area_target = 0.025
-sigma_area = 0.025
-circle_areas = np.clip(
-    np.random.normal(loc=mean_area_target, scale=sigma_area, size=n_circles),
-    a_min=mean_area_target,
-    a_max=None,
-)
-circle_radii = [math.sqrt(a / math.pi) for a in circle_areas]
-conn_bottom = np.mean([pt[1] for pt in fat_ct_interface_points])
-conn_top = np.mean([pt[1] for pt in ct_epitell_interface_points])
-
-circle_centers = []
-for i, r_new in enumerate(circle_radii):
-    for _ in range(1000):
-        x, y = np.random.uniform(r_new, width - r_new), np.random.uniform(conn_bottom + r_new, conn_top - r_new)
-        if all(
-            math.hypot(x - cx, y - cy) >= (r_new + cr)
-            for (cx, cy), cr in zip(circle_centers, circle_radii[: len(circle_centers)])
-        ):
-            circle_centers.append((x, y))
-            break
-
-with BuildSketch(Plane.XY) as circles_sketch:
-    for center, radius in zip(circle_centers, circle_radii):
-        with Locations(center):
-            Circle(radius)
-    circles = circles_sketch.faces()
-show_object(circles, options={"color": (1.0, 0.0, 0.0)})
-export_dxf(circles, "Connective Tissue Circles", "ParameterizedDesign/DXF/connective_tissue_circles.dxf")
-connective_face = outer_connective_face.cut(*circles)
-show_object(connective_face, options={"color": connective_color})
-export_dxf(connective_face, "Connective Tissue", "ParameterizedDesign/DXF/connective_face.dxf")
-
-# Fat circles
-n_fat_circles = 50
-mean_area_fat = 0.05
-sigma_area_fat = 0.05
-fat_circle_areas = np.clip(
-    np.random.normal(loc=mean_area_fat, scale=sigma_area_fat, size=n_fat_circles),
-    a_min=mean_area_fat,
-    a_max=None,
-)
-fat_circle_radii = [math.sqrt(a / math.pi) for a in fat_circle_areas]
-fat_top_bound = min(pt[1] for pt in fat_ct_interface_points)
-
-fat_circle_centers = []
-for i, r_new in enumerate(fat_circle_radii):
-    for _ in range(1000):
-        x, y = np.random.uniform(r_new, width - r_new), np.random.uniform(r_new, fat_top_bound - r_new)
-        if all(
-            math.hypot(x - cx, y - cy) >= (r_new + cr)
-            for (cx, cy), cr in zip(fat_circle_centers, fat_circle_radii[: len(fat_circle_centers)])
-        ):
-            fat_circle_centers.append((x, y))
-            break
-
-with BuildSketch(Plane.XY) as fat_circles_sketch:
-    for center, radius in zip(fat_circle_centers, fat_circle_radii):
-        with Locations(center):
-            Circle(radius)
-    fat_circles = fat_circles_sketch.faces()
-show_object(fat_circles, options={"color": (1.0, 0.0, 1.0)})
-export_dxf(fat_circles, "Fat Circles", "ParameterizedDesign/DXF/fat_circles.dxf")
-fat_face_with_cuts = fat_face.cut(*fat_circles)
-show_object(fat_face_with_cuts, options={"color": fat_color})
-export_dxf(fat_face_with_cuts, "Fat", "ParameterizedDesign/DXF/fat_face_with_circles.dxf")
-
-# Epitell region
-with BuildSketch(Plane.XY) as epitell_sketch:
-    with BuildLine():
-        Spline(ct_epitell_interface_points)
-        Line((width, ct_epitell_interface_points[-1][1]), (width, epitell_top))
-        Line((width, epitell_top), (0, epitell_top))
-        Line((0, epitell_top), (0, ct_epitell_interface_points[0][1]))
-    epitell_face = make_face()
-show_object(epitell_face, options={"color": epitell_color})
-export_dxf(epitell_face, "Epitell", "ParameterizedDesign/DXF/epitell_face.dxf")
-
-# Keratin region
-with BuildSketch(Plane.XY) as keratin_sketch:
-    with BuildLine():
-        Line((0, epitell_top), (width, epitell_top))
-        Line((width, epitell_top), (width, epitell_top + keratin_height))
-        Line((width, epitell_top + keratin_height), (0, epitell_top + keratin_height))
-        Line((0, epitell_top + keratin_height), (0, epitell_top))
-    keratin_face = make_face()
-show_object(keratin_face, options={"color": keratin_color})
-export_dxf(keratin_face, "Keratin", "ParameterizedDesign/DXF/keratin_face.dxf")
-
-# Saliva region
-current_y = epitell_top + keratin_height
-with BuildSketch(Plane.XY) as saliva_sketch:
-    with BuildLine():
-        Line((0, current_y), (width, current_y))
-        Line((width, current_y), (width, current_y + saliva_height))
-        Line((width, current_y + saliva_height), (0, current_y + saliva_height))
-        Line((0, current_y + saliva_height), (0, current_y))
-    saliva_face = make_face()
-show_object(saliva_face, options={"color": saliva_color})
-export_dxf(saliva_face, "Saliva", "ParameterizedDesign/DXF/saliva_face.dxf")
-
-# Metal plate region
-current_y += saliva_height
-with BuildSketch(Plane.XY) as metal_plate_sketch:
-    with BuildLine():
-        Line((0, current_y), (width, current_y))
-        Line((width, current_y), (width, current_y + metal_plate_height))
-        Line((width, current_y + metal_plate_height), (0, current_y + metal_plate_height))
-        Line((0, current_y + metal_plate_height), (0, current_y))
-    metal_plate_face = make_face()
-show_object(metal_plate_face, options={"color": metal_plate_color})
-export_dxf(metal_plate_face, "Metal plate", "ParameterizedDesign/DXF/metal_plate_face.dxf")
+            Line((width, 0), (width, fat_ct_interface_points[-1, 1]))
+            Spline([tuple(pt) for pt in fat_ct_interface_points])
+            Line((0, fat_ct_interface_points[0, 1]), (0, 0))
+        fat_face = make_face()
+    show(fat_face, options={"color": fat_color})
+    export_dxf(fat_face, "Fat", f"{dxf_dir}/fat_face.dxf")
+
+    # Connective tissue (outer)
+    with BuildSketch(Plane.XY) as connective_sketch:
+        with BuildLine():
+            Spline([tuple(pt) for pt in fat_ct_interface_points])
+            Line((width, fat_ct_interface_points[-1, 1]), (width, ct_epitell_interface_points[-1, 1]))
+            Spline([tuple(pt) for pt in ct_epitell_interface_points])
+            Line((0, ct_epitell_interface_points[0, 1]), (0, fat_ct_interface_points[0, 1]))
+        outer_connective_face = make_face()
+    show(outer_connective_face, options={"color": connective_color})
+
+    # Create and cut circles in connective tissue
+    n_circles = 20
+    mean_area_target = 0.025
+    sigma_area = 0.025
+    circle_areas = np.clip(
+        rng.normal(loc=mean_area_target, scale=sigma_area, size=n_circles),
+        a_min=mean_area_target,
+        a_max=None,
+    )
+    circle_radii = [math.sqrt(a / math.pi) for a in circle_areas]
+    conn_bottom = fat_ct_interface_points[:, 1].mean()
+    conn_top = ct_epitell_interface_points[:, 1].mean()
+    if conn_top <= conn_bottom:
+        raise ValueError(
+            f"connective_tissue_height={connective_tissue_height} leaves no connective tissue band "
+            f"between the interfaces (mean bottom {conn_bottom:.3f}, mean top {conn_top:.3f})"
+        )
+
+    circle_centers, circle_radii = place_circles(circle_radii, conn_bottom, conn_top, width, rng)
+
+    with BuildSketch(Plane.XY) as circles_sketch:
+        for (cx, cy), radius in zip(circle_centers, circle_radii):
+            with Locations((cx, cy)):
+                Circle(radius)
+        circles = circles_sketch.faces()
+    show(circles, options={"color": (1.0, 0.0, 0.0)})
+    export_dxf(circles, "Connective Tissue Circles", f"{dxf_dir}/connective_tissue_circles.dxf")
+    # Subtract all circles in one boolean against a single compound tool
+    connective_face = outer_connective_face.cut(Compound(circles))
+    show(connective_face, options={"color": connective_color})
+    export_dxf(connective_face, "Connective Tissue", f"{dxf_dir}/connective_face.dxf")
+
+    # Fat circles
+    n_fat_circles = 50
+    mean_area_fat = 0.05
+    sigma_area_fat = 0.05
+    fat_circle_areas = np.clip(
+        rng.normal(loc=mean_area_fat, scale=sigma_area_fat, size=n_fat_circles),
+        a_min=mean_area_fat,
+        a_max=None,
+    )
+    fat_circle_radii = [math.sqrt(a / math.pi) for a in fat_circle_areas]
+    fat_top_bound = fat_ct_interface_points[:, 1].min()
+    if fat_top_bound <= 0:
+        raise ValueError(
+            f"fat_nominal_height={fat_nominal_height} leaves no fat band below the fat/CT interface "
+            f"(lowest point {fat_top_bound:.3f})"
+        )
+
+    fat_circle_centers, fat_circle_radii = place_circles(fat_circle_radii, 0, fat_top_bound, width, rng)
+
+    with BuildSketch(Plane.XY) as fat_circles_sketch:
+        for (cx, cy), radius in zip(fat_circle_centers, fat_circle_radii):
+            with Locations((cx, cy)):
+                Circle(radius)
+        fat_circles = fat_circles_sketch.faces()
+    show(fat_circles, options={"color": (1.0, 0.0, 1.0)})
+    export_dxf(fat_circles, "Fat Circles", f"{dxf_dir}/fat_circles.dxf")
+    fat_face_with_cuts = fat_face.cut(Compound(fat_circles))
+    show(fat_face_with_cuts, options={"color": fat_color})
+    export_dxf(fat_face_with_cuts, "Fat", f"{dxf_dir}/fat_face_with_circles.dxf")
+
+    # Epitell region
+    with BuildSketch(Plane.XY) as epitell_sketch:
+        with BuildLine():
+            Spline([tuple(pt) for pt in ct_epitell_interface_points])
+            Line((width, ct_epitell_interface_points[-1, 1]), (width, epitell_top))
+            Line((width, epitell_top), (0, epitell_top))
+            Line((0, epitell_top), (0, ct_epitell_interface_points[0, 1]))
+        epitell_face = make_face()
+    show(epitell_face, options={"color": epitell_color})
+    export_dxf(epitell_face, "Epitell", f"{dxf_dir}/epitell_face.dxf")
+
+    # Keratin region
+    keratin_face = rectangle_face(width, epitell_top, keratin_top)
+    show(keratin_face, options={"color": keratin_color})
+    export_dxf(keratin_face, "Keratin", f"{dxf_dir}/keratin_face.dxf")
+
+    # Saliva region
+    saliva_face = rectangle_face(width, keratin_top, saliva_top)
+    show(saliva_face, options={"color": saliva_color})
+    export_dxf(saliva_face, "Saliva", f"{dxf_dir}/saliva_face.dxf")
+
+    # Metal plate region
+    metal_plate_face = rectangle_face(width, saliva_top, plate_top)
+    show(metal_plate_face, options={"color": metal_plate_color})
+    export_dxf(metal_plate_face, "Metal plate", f"{dxf_dir}/metal_plate_face.dxf")
+
+    return {
+        "overall": overall_face,
+        "fat": fat_face_with_cuts,
+        "fat_circles": fat_circles,
+        "connective": connective_face,
+        "connective_circles": circles,
+        "epitell": epitell_face,
+        "keratin": keratin_face,
+        "saliva": saliva_face,
+        "metal_plate": metal_plate_face,
+    }
+
+
+if __name__ == "__main__":
+    build_model()